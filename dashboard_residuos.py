@@ -8,10 +8,13 @@ Versión: 1.0 PILOTO | Propuesta: Clasificación QR Semiautomatizada
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
+import difflib
+import unicodedata
 import warnings
 warnings.filterwarnings('ignore')
 
@@ -69,6 +72,172 @@ if 'df_original' not in st.session_state:
     st.session_state.df_original = None
 if 'df_processed' not in st.session_state:
     st.session_state.df_processed = None
+if 'indice_diario' not in st.session_state:
+    st.session_state.indice_diario = None
+if 'df_cuarentena' not in st.session_state:
+    st.session_state.df_cuarentena = None
+if 'archivo_cargado' not in st.session_state:
+    st.session_state.archivo_cargado = None
+if 'version_datos' not in st.session_state:
+    st.session_state.version_datos = 0
+if 'indice_entidades' not in st.session_state:
+    st.session_state.indice_entidades = None
+    st.session_state.clave_entidades = None
+
+# ============================================================================
+# ESQUEMA Y VALIDACIÓN DE DATOS
+# ============================================================================
+
+# Encabezados aceptados por columna (se comparan normalizados y con tolerancia)
+ENCABEZADOS_ESPERADOS = {
+    'timestamp': ['Marca temporal', 'Fecha', 'Fecha y hora'],
+    'usuario': ['1. USUARIO', 'Usuario', 'Nombre'],
+    'area': ['2. ÁREA', 'Área', 'Servicio'],
+    'tipo_residuo': ['3. TIPO DE RESIDUOS', 'Tipo de residuo'],
+    'color_recipiente': ['COLOR DEL RECIPIENTE', 'Recipiente'],
+    'estado_recipiente': ['Columna 12', 'Estado del recipiente', 'Estado'],
+    'observaciones': ['Columna 13', 'Observaciones', 'Novedades']
+}
+
+COLUMNAS_OBLIGATORIAS = ['timestamp', 'usuario', 'tipo_residuo']
+
+MAPEO_RECIPIENTE = {
+    'BIOSANITARIOS': 'ROJO',
+    'ANATOMOPATOLOGICOS': 'ROJO',
+    'CORTOPUNZANTES': 'GUARDIAN',
+    'RESIDUOS QUIMICOS DE LABORATORIO CLINICO': 'ROJO',
+    'RESIDUOS QUIMICOS DE ODONTOLOGIA E HIGIENE ORAL': 'ROJO',
+    'RESIDUOS APROVECHABLES': 'BLANCO',
+    'RESIDUOS NO APROVECHABLES': 'NEGRO'
+}
+
+COLORES_RECIPIENTE = ['ROJO', 'GUARDIAN', 'BLANCO', 'NEGRO', 'VERDE', 'GRIS']
+
+# Prefijo normalizado -> estado canónico (cubre 'VACIO (<25%)', 'VACÍO  (<25%)', etc.)
+ESTADOS_RECIPIENTE = {
+    'VACIO': 'VACÍO',
+    'MEDIO': 'MEDIO',
+    'LLENO': 'LLENO',
+    'NO REGISTRADO': 'NO REGISTRADO'
+}
+
+def normalizar_texto(valor):
+    """Mayúsculas, sin tildes y con espacios simples"""
+    texto = unicodedata.normalize('NFKD', str(valor))
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return ' '.join(texto.upper().split())
+
+def resolver_encabezados(columnas):
+    """Asocia cada columna esperada con el encabezado más parecido del archivo"""
+    normalizados = {normalizar_texto(col): col for col in columnas}
+    sin_numeracion = {n.lstrip('0123456789. '): col for n, col in normalizados.items()}
+
+    def digitos(texto):
+        return ''.join(c for c in texto if c.isdigit())
+
+    resueltos = {}
+    # Primera pasada: coincidencia exacta (ignorando tildes, mayúsculas y numeración)
+    for destino, alias in ENCABEZADOS_ESPERADOS.items():
+        for nombre in map(normalizar_texto, alias):
+            candidato = normalizados.get(nombre) or sin_numeracion.get(nombre.lstrip('0123456789. '))
+            if candidato is not None and candidato not in resueltos.values():
+                resueltos[destino] = candidato
+                break
+
+    # Segunda pasada: encabezados parecidos, sin confundir 'Columna 12' con 'Columna 13'
+    for destino, alias in ENCABEZADOS_ESPERADOS.items():
+        if destino in resueltos:
+            continue
+        libres = [n for n, col in normalizados.items() if col not in resueltos.values()]
+        for nombre in map(normalizar_texto, alias):
+            opciones = [n for n in libres if digitos(n) == digitos(nombre)]
+            parecidos = difflib.get_close_matches(nombre, opciones, n=1, cutoff=0.85)
+            if parecidos:
+                resueltos[destino] = normalizados[parecidos[0]]
+                break
+    return resueltos
+
+def normalizar_columna(serie, funcion):
+    """Normaliza solo los valores distintos de la serie; devuelve (valores, máscara de inválidos)
+
+    `funcion` recibe cada valor distinto y devuelve su forma canónica o None si
+    no pertenece al dominio. Los vacíos se conservan como NaN y no son inválidos.
+    """
+    codigos, unicos = pd.factorize(serie)
+    canonicos = [funcion(valor) for valor in unicos]
+    valores = np.array(canonicos + [np.nan], dtype=object)
+    invalidos = np.array([valor is None for valor in canonicos] + [False])
+    valores[:-1][invalidos[:-1]] = np.nan
+    return pd.Series(valores[codigos], index=serie.index), invalidos[codigos]
+
+def validar_datos(df):
+    """Renombra, normaliza y valida registros; devuelve (validos, cuarentena)"""
+    encabezados = resolver_encabezados(df.columns)
+    faltantes = [col for col in COLUMNAS_OBLIGATORIAS if col not in encabezados]
+    if faltantes:
+        raise ValueError(f"Columnas obligatorias no encontradas: {', '.join(faltantes)}")
+
+    original = df
+    df = df.rename(columns={origen: destino for destino, origen in encabezados.items()})
+    for col in ENCABEZADOS_ESPERADOS:
+        if col not in df.columns:
+            df[col] = pd.Series(np.nan, index=df.index, dtype=object)
+
+    tipos = {normalizar_texto(tipo): tipo for tipo in MAPEO_RECIPIENTE}
+    colores = {normalizar_texto(color): color for color in COLORES_RECIPIENTE}
+
+    # Celdas solo con espacios cuentan como vacías (NaN), no como fuera del dominio (None)
+    def buscar_en(dominio):
+        def buscar(valor):
+            texto = normalizar_texto(valor)
+            return dominio.get(texto) if texto else np.nan
+        return buscar
+
+    def normalizar_estado(valor):
+        texto = normalizar_texto(valor)
+        if not texto:
+            return np.nan
+        for prefijo, estado in ESTADOS_RECIPIENTE.items():
+            if texto.startswith(prefijo):
+                return estado
+        return None
+
+    def limpiar_espacios(valor):
+        return ' '.join(str(valor).split()) or np.nan
+
+    df['usuario'], _ = normalizar_columna(df['usuario'], limpiar_espacios)
+    df['area'], _ = normalizar_columna(df['area'], limpiar_espacios)
+    df['observaciones'], _ = normalizar_columna(df['observaciones'], limpiar_espacios)
+    df['tipo_residuo'], tipo_invalido = normalizar_columna(df['tipo_residuo'], buscar_en(tipos))
+    df['color_recipiente'], color_invalido = normalizar_columna(df['color_recipiente'], buscar_en(colores))
+    df['estado_recipiente'], estado_invalido = normalizar_columna(df['estado_recipiente'], normalizar_estado)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M:%S', errors='coerce')
+
+    reglas = {
+        'FECHA INVÁLIDA': df['timestamp'].isna().to_numpy(),
+        'USUARIO VACÍO': df['usuario'].isna().to_numpy(),
+        'TIPO DE RESIDUO VACÍO': df['tipo_residuo'].isna().to_numpy() & ~tipo_invalido,
+        'TIPO DE RESIDUO DESCONOCIDO': tipo_invalido,
+        'COLOR DE RECIPIENTE DESCONOCIDO': color_invalido,
+        'ESTADO DE RECIPIENTE DESCONOCIDO': estado_invalido
+    }
+
+    # Cada regla es un bit; los motivos se arman una vez por combinación distinta
+    banderas = np.zeros(len(df), dtype=np.int64)
+    for bit, mascara in enumerate(reglas.values()):
+        banderas |= mascara.astype(np.int64) << bit
+    invalido = banderas != 0
+
+    cuarentena = original[invalido].copy()
+    codigos, combinaciones = pd.factorize(banderas[invalido])
+    nombres = list(reglas)
+    motivos = np.array([
+        '; '.join(nombre for bit, nombre in enumerate(nombres) if combinacion >> bit & 1)
+        for combinacion in combinaciones
+    ], dtype=object)
+    cuarentena['motivo'] = motivos[codigos]
+
+    return df[~invalido].copy(), cuarentena
 
 # ============================================================================
 # FUNCIONES AUXILIARES
@@ -82,25 +251,18 @@ def cargar_datos(file):
         else:
             df = pd.read_excel(file)
 
-        # Renombrar columnas clave
-        cols_mapping = {
-            'Marca temporal': 'timestamp',
-            '1. USUARIO': 'usuario',
-            '2. ÁREA': 'area',
-            '3. TIPO DE RESIDUOS ': 'tipo_residuo',
-            'COLOR DEL RECIPIENTE': 'color_recipiente',
-            'Columna 12': 'estado_recipiente',
-            'Columna 13': 'observaciones'
-        }
-        df = df.rename(columns=cols_mapping)
+        # Validar esquema y separar registros inválidos
+        df, cuarentena = validar_datos(df)
+        st.session_state.df_cuarentena = cuarentena
 
-        # Procesar timestamp
-        df['timestamp'] = pd.to_datetime(df['timestamp'], format='%m/%d/%Y %H:%M:%S', errors='coerce')
         df['fecha'] = df['timestamp'].dt.date
         df['hora'] = df['timestamp'].dt.hour
 
         st.session_state.df_original = df.copy()
         return df
+    except ValueError as e:
+        st.error(f"Archivo con formato inválido: {e}")
+        return None
     except Exception as e:
         st.error(f"Error cargando archivo: {e}")
         return None
@@ -116,15 +278,8 @@ def procesar_datos(df):
     df.loc[df['observaciones'].str.contains('DERRAME', na=False, case=False), 'incidente'] = 'DERRAME'
     df.loc[df['observaciones'].str.contains('RECIPIENTE ROTO', na=False, case=False), 'incidente'] = 'RECIPIENTE ROTO'
 
-    # Limpieza estado recipiente
+    # Limpieza estado recipiente (variantes ya normalizadas en validar_datos)
     df['estado_recipiente'] = df['estado_recipiente'].fillna('NO REGISTRADO')
-    df['estado_recipiente'] = df['estado_recipiente'].replace({
-        'VACIO (<25%)': 'VACÍO',
-        'VACIO  (<25%)': 'VACÍO',
-        'VACÍO (<25%)': 'VACÍO',
-        'MEDIO (25% - 75%)': 'MEDIO',
-        'LLENO (>75%)': 'LLENO'
-    })
 
     st.session_state.df_processed = df
     return df
@@ -150,25 +305,175 @@ def calcular_metricas(df):
         'quimicos': residuos_quimicos
     }
 
+DIMENSIONES_INDICE = {
+    'Área': 'area',
+    'Tipo de Residuo': 'tipo_residuo',
+    'Área y Tipo de Residuo': ['area', 'tipo_residuo']
+}
+
+MODOS_COMPARACION = [
+    'Semana vs semana anterior',
+    'Mes vs mismo mes año anterior',
+    'Rango seleccionado vs período anterior'
+]
+
+def construir_indice_diario(df):
+    """Construye sumas acumuladas diarias de registros e incidentes por combinación área × tipo de residuo"""
+    dias = pd.to_datetime(df['fecha'], errors='coerce')
+    validos = dias.notna().to_numpy()
+    if not validos.any():
+        return None
+
+    dias = dias[validos]
+    inicio = dias.min()
+    n_dias = (dias.max() - inicio).days + 1
+    # Fila 0 reservada como acumulado vacío: total de [i, j] = acum[j + 1] - acum[i]
+    posicion = (dias - inicio).dt.days.to_numpy() + 1
+    es_incidente = (df.loc[validos, 'incidente'] != 'NO').to_numpy()
+
+    # Una columna por combinación observada (área, tipo); los vacíos se conservan como NaN
+    codigos_area, areas = pd.factorize(df.loc[validos, 'area'])
+    codigos_tipo, tipos = pd.factorize(df.loc[validos, 'tipo_residuo'])
+    codigos, combinaciones = pd.factorize((codigos_area + 1) * (len(tipos) + 1) + codigos_tipo + 1)
+    n_claves = len(combinaciones)
+    # El código -1 (vacío) toma el NaN agregado al final
+    claves = pd.DataFrame({
+        'area': np.append(areas.to_numpy(dtype=object), np.nan)[combinaciones // (len(tipos) + 1) - 1],
+        'tipo_residuo': np.append(tipos.to_numpy(dtype=object), np.nan)[combinaciones % (len(tipos) + 1) - 1]
+    })
+
+    celdas = posicion * n_claves + codigos
+    registros = np.bincount(celdas, minlength=(n_dias + 1) * n_claves)
+    incidentes = np.bincount(celdas[es_incidente], minlength=(n_dias + 1) * n_claves)
+
+    return {
+        'inicio': inicio,
+        'dias': n_dias,
+        'claves': claves,
+        'registros': registros.reshape(n_dias + 1, n_claves).cumsum(axis=0),
+        'incidentes': incidentes.reshape(n_dias + 1, n_claves).cumsum(axis=0)
+    }
+
+def rango_indice(indice):
+    """Primera y última fecha cubiertas por el índice diario"""
+    return indice['inicio'].date(), (indice['inicio'] + timedelta(days=indice['dias'] - 1)).date()
+
+def consultar_rango(indice, desde, hasta, columna, areas=None, tipos=None):
+    """Totales de registros e incidentes entre dos fechas (inclusive) por clave de la dimensión
+
+    `areas` y `tipos` restringen las combinaciones sumadas, igual que los filtros del sidebar.
+    Con `columna=None` devuelve el total de todas las combinaciones, incluidas las de área vacía.
+    """
+    inicio = (pd.Timestamp(desde).normalize() - indice['inicio']).days
+    fin = (pd.Timestamp(hasta).normalize() - indice['inicio']).days + 1
+    inicio = min(max(inicio, 0), indice['dias'])
+    fin = min(max(fin, inicio), indice['dias'])
+
+    tabla = indice['claves'].assign(
+        Registros=indice['registros'][fin] - indice['registros'][inicio],
+        Incidentes=indice['incidentes'][fin] - indice['incidentes'][inicio]
+    )
+    if areas is not None:
+        tabla = tabla[tabla['area'].isin(areas)]
+    if tipos is not None:
+        tabla = tabla[tabla['tipo_residuo'].isin(tipos)]
+    if columna is None:
+        return tabla[['Registros', 'Incidentes']].sum()
+    return tabla.groupby(columna)[['Registros', 'Incidentes']].sum()
+
+def periodos_comparacion(modo, desde, hasta):
+    """Devuelve los rangos (actual, anterior) a comparar según el modo seleccionado"""
+    desde = pd.Timestamp(desde).normalize()
+    hasta = pd.Timestamp(hasta).normalize()
+
+    if modo == 'Semana vs semana anterior':
+        actual = (hasta - timedelta(days=6), hasta)
+        anterior = (hasta - timedelta(days=13), hasta - timedelta(days=7))
+    elif modo == 'Mes vs mismo mes año anterior':
+        inicio_mes = hasta.replace(day=1)
+        actual = (inicio_mes, hasta)
+        anterior = (inicio_mes - pd.DateOffset(years=1), hasta - pd.DateOffset(years=1))
+    else:
+        duracion = hasta - desde + timedelta(days=1)
+        actual = (desde, hasta)
+        anterior = (desde - duracion, hasta - duracion)
+    return actual, anterior
+
+def comparar_periodos(indice, actual, anterior, columna, areas=None, tipos=None):
+    """Compara registros e incidentes de dos períodos por clave de la dimensión"""
+    tabla_actual = consultar_rango(indice, actual[0], actual[1], columna, areas, tipos)
+    tabla_anterior = consultar_rango(indice, anterior[0], anterior[1], columna, areas, tipos)
+
+    comparacion = pd.DataFrame({
+        'Registros': tabla_actual['Registros'],
+        'Registros Anterior': tabla_anterior['Registros'],
+        'Incidentes': tabla_actual['Incidentes'],
+        'Incidentes Anterior': tabla_anterior['Incidentes']
+    })
+    comparacion['Δ Registros'] = comparacion['Registros'] - comparacion['Registros Anterior']
+    comparacion['Δ Incidentes'] = comparacion['Incidentes'] - comparacion['Incidentes Anterior']
+    comparacion['Δ % Registros'] = (
+        comparacion['Δ Registros'] / comparacion['Registros Anterior'].replace(0, np.nan) * 100
+    ).round(2)
+    return comparacion
+
 def crear_prediccion_qr(df):
     """Modelo predictivo simple para sugerir recipiente"""
     try:
-        mapeo_recipiente = {
-            'BIOSANITARIOS': 'ROJO',
-            'ANATOMOPATOLOGICOS': 'ROJO',
-            'CORTOPUNZANTES': 'GUARDIAN',
-            'RESIDUOS QUIMICOS DE LABORATORIO CLINICO': 'ROJO',
-            'RESIDUOS QUIMICOS DE ODONTOLOGIA E HIGIENE ORAL': 'ROJO',
-            'RESIDUOS APROVECHABLES': 'BLANCO',
-            'RESIDUOS NO APROVECHABLES': 'NEGRO'
-        }
-
-        df['recipiente_predicho'] = df['tipo_residuo'].map(mapeo_recipiente).fillna('REVISAR')
-        df['es_incorrecto'] = (df['color_recipiente'].str.upper() != df['recipiente_predicho'].str.upper())
+        df['recipiente_predicho'] = df['tipo_residuo'].map(MAPEO_RECIPIENTE).fillna('REVISAR')
+        # Sin color registrado no se puede evaluar: queda como NA
+        df['es_incorrecto'] = (
+            df['color_recipiente'].str.upper() != df['recipiente_predicho'].str.upper()
+        ).astype('boolean').mask(df['color_recipiente'].isna())
         return df
     except:
         return df
 
+def registros_correctos(df):
+    """1.0 si el recipiente coincide con el predicho, 0.0 si no y NaN si no hay color registrado"""
+    if 'es_incorrecto' not in df.columns:
+        return pd.Series(np.nan, index=df.index)
+    return (~df['es_incorrecto']).astype(float)
+
+def construir_indice_entidades(df):
+    """Indexa filas, relaciones y estadísticas por usuario y por área"""
+    es_incidente = df['incidente'] != 'NO'
+    es_correcto = registros_correctos(df)
+
+    indice = {}
+    for columna in ('usuario', 'area'):
+        claves = df[columna]
+        registros = claves.value_counts().sort_index()
+        incidentes = es_incidente.groupby(claves).sum().reindex(registros.index)
+        correctos = es_correcto.groupby(claves).mean().reindex(registros.index)
+
+        stats = pd.DataFrame({
+            'Registros': registros,
+            'Incidentes': incidentes,
+            '% Incidentes': (incidentes / registros * 100).round(2),
+            '% Recipiente Correcto': (correctos * 100).round(2)
+        })
+        stats.index.name = columna
+        indice[columna] = {
+            'filas': df.groupby(columna, sort=True).indices,
+            'stats': stats
+        }
+
+    pares = df[['area', 'usuario']].dropna().drop_duplicates()
+    indice['area_usuarios'] = pares.groupby('area')['usuario'].agg(list).to_dict()
+    indice['usuario_areas'] = pares.groupby('usuario')['area'].agg(list).to_dict()
+    indice['area']['stats'].insert(1, 'Usuarios', pd.Series(
+        {area: len(usuarios) for area, usuarios in indice['area_usuarios'].items()}
+    ).reindex(indice['area']['stats'].index).fillna(0).astype(int))
+    return indice
+
+def filas_entidad(df, indice, columna, clave):
+    """Devuelve solo las filas de un usuario o área usando el índice de entidades"""
+    filas = indice[columna]['filas'].get(clave)
+    if filas is None:
+        return df.iloc[0:0]
+    return df.iloc[filas]
+
 def generar_reporte_pdf(df, metricas):
     """Genera reporte en formato texto"""
     reporte = f"""
@@ -219,11 +524,18 @@ with st.sidebar:
         help="Formato: CSV con delimitador ';' o Excel"
     )
 
-    if uploaded_file:
+    if uploaded_file and uploaded_file.file_id == st.session_state.archivo_cargado:
+        # Mismo archivo: se reutilizan los datos e índices ya construidos
+        df = st.session_state.df_processed
+        st.success(f"✓ Datos cargados: {len(df)} registros")
+    elif uploaded_file:
         with st.spinner("Cargando datos..."):
             df = cargar_datos(uploaded_file)
             if df is not None:
                 df = procesar_datos(df)
+                st.session_state.indice_diario = construir_indice_diario(df)
+                st.session_state.archivo_cargado = uploaded_file.file_id
+                st.session_state.version_datos += 1
                 st.success(f"✓ Datos cargados: {len(df)} registros")
     elif st.session_state.df_original is not None:
         df = st.session_state.df_processed
@@ -232,11 +544,29 @@ with st.sidebar:
         st.warning("⚠️ No hay datos cargados. Carga un archivo para comenzar.")
         df = None
 
+    cuarentena = st.session_state.df_cuarentena
+    if df is not None and cuarentena is not None and len(cuarentena) > 0:
+        st.warning(f"⚠️ {len(cuarentena)} registros en cuarentena (no incluidos en el análisis)")
+        with st.expander("Ver motivos de cuarentena"):
+            st.dataframe(cuarentena['motivo'].value_counts(), use_container_width=True)
+
     st.markdown("---")
 
     # Opciones de análisis
     st.header("⚙️ Opciones")
     if df is not None:
+        if st.session_state.indice_diario is not None:
+            fecha_min, fecha_max = rango_indice(st.session_state.indice_diario)
+        else:
+            fecha_min = fecha_max = datetime.now().date()
+        rango_fechas = st.date_input(
+            "Filtrar por Rango de Fechas",
+            value=(fecha_min, fecha_max),
+            min_value=fecha_min,
+            max_value=fecha_max
+        )
+        fecha_desde, fecha_hasta = rango_fechas if len(rango_fechas) == 2 else (fecha_min, fecha_max)
+
         filtro_area = st.multiselect(
             "Filtrar por Área",
             options=df['area'].dropna().unique(),
@@ -253,6 +583,10 @@ with st.sidebar:
         if filtro_area and filtro_residuo:
             df = df[(df['area'].isin(filtro_area)) & (df['tipo_residuo'].isin(filtro_residuo))]
 
+        if (fecha_desde, fecha_hasta) != (fecha_min, fecha_max):
+            df = df[(df['timestamp'] >= pd.Timestamp(fecha_desde)) &
+                    (df['timestamp'] < pd.Timestamp(fecha_hasta) + timedelta(days=1))]
+
     st.markdown("---")
     st.header("📊 Exportar")
     if df is not None:
@@ -273,22 +607,40 @@ with st.sidebar:
             mime="text/plain"
         )
 
+        if cuarentena is not None and len(cuarentena) > 0:
+            st.download_button(
+                label="🚫 Descargar Cuarentena",
+                data=cuarentena.to_csv(index=False, sep=';', encoding='utf-8'),
+                file_name=f"cuarentena_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv"
+            )
+
 # ============================================================================
 # CONTENIDO PRINCIPAL - TABS
 # ============================================================================
 if df is not None and len(df) > 0:
-    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6, tab7 = st.tabs([
         "📊 Vista General",
         "♻️ Análisis Residuos",
         "📍 Por Área",
         "⚠️ Incidentes",
         "🔮 Predicciones QR",
-        "📈 Comparativas"
+        "📈 Comparativas",
+        "🔎 Detalle"
     ])
 
     metricas = calcular_metricas(df)
     df = crear_prediccion_qr(df)
 
+    # El índice de entidades se reconstruye solo si cambian los datos o los filtros
+    clave_entidades = (
+        st.session_state.version_datos, tuple(filtro_area), tuple(filtro_residuo), fecha_desde, fecha_hasta
+    )
+    if st.session_state.clave_entidades != clave_entidades:
+        st.session_state.indice_entidades = construir_indice_entidades(df)
+        st.session_state.clave_entidades = clave_entidades
+    indice_entidades = st.session_state.indice_entidades
+
     # ========== TAB 1: VISTA GENERAL ==========
     with tab1:
         st.header("📊 Vista General")
@@ -492,16 +844,7 @@ if df is not None and len(df) > 0:
         col1, col2 = st.columns(2)
 
         with col1:
-            area_tabla = df.groupby('area').agg({
-                'area': 'count',
-                'usuario': 'nunique',
-                'incidente': lambda x: (x != 'NO').sum()
-            }).rename(columns={
-                'area': 'Registros',
-                'usuario': 'Usuarios',
-                'incidente': 'Incidentes'
-            })
-            area_tabla['% Incidentes'] = (area_tabla['Incidentes'] / area_tabla['Registros'] * 100).round(2)
+            area_tabla = indice_entidades['area']['stats'][['Registros', 'Usuarios', 'Incidentes', '% Incidentes']]
             st.dataframe(area_tabla, use_container_width=True)
 
         with col2:
@@ -516,8 +859,7 @@ if df is not None and len(df) > 0:
         st.markdown("---")
 
         st.subheader("👥 Personal por Área")
-        for area in df['area'].dropna().unique():
-            usuarios = df[df['area'] == area]['usuario'].unique()
+        for area, usuarios in indice_entidades['area_usuarios'].items():
             col1, col2 = st.columns([1, 3])
             with col1:
                 st.write(f"**{area}**")
@@ -582,9 +924,9 @@ if df is not None and len(df) > 0:
         col1, col2, col3 = st.columns(3)
 
         with col1:
-            predicciones_correctas = (df['es_incorrecto'] == False).sum()
-            pct_correcto = (predicciones_correctas / len(df) * 100) if len(df) > 0 else 0
-            st.metric("Precisión Actual", f"{pct_correcto:.1f}%")
+            # Misma definición que en el detalle: solo registros con color de recipiente
+            pct_correcto = registros_correctos(df).mean() * 100
+            st.metric("Precisión Actual", "—" if pd.isna(pct_correcto) else f"{pct_correcto:.1f}%")
 
         with col2:
             proyectado_30d = len(df) * 3
@@ -601,7 +943,7 @@ if df is not None and len(df) > 0:
         col1, col2 = st.columns(2)
 
         with col1:
-            incorrectos = df[df['es_incorrecto'] == True]
+            incorrectos = df[df['es_incorrecto'].fillna(False).astype(bool)]
             if len(incorrectos) > 0:
                 confusion_data = incorrectos.groupby(['tipo_residuo', 'color_recipiente']).size().reset_index(name='cantidad')
                 fig_confusion = px.bar(
@@ -639,11 +981,7 @@ if df is not None and len(df) > 0:
         st.header("📈 Comparativas Avanzadas")
 
         st.subheader("1️⃣ Usuarios vs Incidentes")
-        usuario_stats = df.groupby('usuario').agg({
-            'usuario': 'count',
-            'incidente': lambda x: (x != 'NO').sum()
-        }).rename(columns={'usuario': 'Registros', 'incidente': 'Incidentes'})
-        usuario_stats['% Incidentes'] = (usuario_stats['Incidentes'] / usuario_stats['Registros'] * 100).round(2)
+        usuario_stats = indice_entidades['usuario']['stats'][['Registros', 'Incidentes', '% Incidentes']]
         usuario_stats = usuario_stats.sort_values('Registros', ascending=False)
 
         col1, col2 = st.columns([1, 1])
@@ -702,6 +1040,135 @@ if df is not None and len(df) > 0:
         fig_evo.update_yaxes(title_text="% Incidentes", secondary_y=True)
         st.plotly_chart(fig_evo, use_container_width=True)
 
+        st.markdown("---")
+
+        st.subheader("4️⃣ Comparación de Períodos")
+
+        indice = st.session_state.indice_diario
+        if indice is not None:
+            col1, col2 = st.columns(2)
+            with col1:
+                modo = st.selectbox("Períodos a comparar", MODOS_COMPARACION)
+            with col2:
+                dimension = st.selectbox("Comparar por", list(DIMENSIONES_INDICE.keys()))
+
+            columna = DIMENSIONES_INDICE[dimension]
+            actual, anterior = periodos_comparacion(modo, fecha_desde, fecha_hasta)
+            # Mismos filtros de área y tipo de residuo que el resto del dashboard
+            filtros = (filtro_area, filtro_residuo) if filtro_area and filtro_residuo else (None, None)
+            comparacion = comparar_periodos(indice, actual, anterior, columna, *filtros)
+            # Los totales no dependen del desglose elegido en "Comparar por"
+            total_actual = consultar_rango(indice, actual[0], actual[1], None, *filtros)
+            total_anterior = consultar_rango(indice, anterior[0], anterior[1], None, *filtros)
+
+            st.caption(
+                f"Actual: {actual[0].strftime('%d/%m/%Y')} - {actual[1].strftime('%d/%m/%Y')} | "
+                f"Anterior: {anterior[0].strftime('%d/%m/%Y')} - {anterior[1].strftime('%d/%m/%Y')}"
+            )
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric(
+                    "Registros",
+                    f"{total_actual['Registros']}",
+                    delta=f"{total_actual['Registros'] - total_anterior['Registros']:+d}"
+                )
+            with col2:
+                st.metric(
+                    "Incidentes",
+                    f"{total_actual['Incidentes']}",
+                    delta=f"{total_actual['Incidentes'] - total_anterior['Incidentes']:+d}",
+                    delta_color="inverse"
+                )
+            with col3:
+                st.metric("Registros Período Anterior", f"{total_anterior['Registros']}")
+
+            st.dataframe(comparacion, use_container_width=True)
+
+            etiquetas = [' / '.join(clave) if isinstance(clave, tuple) else clave for clave in comparacion.index]
+            fig_periodos = go.Figure(data=[
+                go.Bar(name='Anterior', x=etiquetas, y=comparacion['Registros Anterior'], marker_color='#a84b2f'),
+                go.Bar(name='Actual', x=etiquetas, y=comparacion['Registros'], marker_color='#208084')
+            ])
+            fig_periodos.update_layout(
+                title=f"Registros por {dimension}: Actual vs Anterior",
+                barmode='group',
+                height=400
+            )
+            st.plotly_chart(fig_periodos, use_container_width=True)
+        else:
+            st.info("No hay fechas válidas para comparar períodos.")
+
+    # ========== TAB 7: DETALLE POR USUARIO / ÁREA ==========
+    with tab7:
+        st.header("🔎 Detalle por Usuario o Área")
+
+        col1, col2 = st.columns([1, 2])
+        with col1:
+            tipo_entidad = st.radio("Ver detalle de", ['Usuario', 'Área'], horizontal=True)
+        columna_entidad = 'usuario' if tipo_entidad == 'Usuario' else 'area'
+        stats_entidad = indice_entidades[columna_entidad]['stats']
+
+        with col2:
+            entidad = st.selectbox(
+                f"Selecciona {tipo_entidad.lower()}",
+                options=stats_entidad.index
+            )
+
+        if entidad is not None:
+            df_entidad = filas_entidad(df, indice_entidades, columna_entidad, entidad)
+            stats = stats_entidad.loc[entidad]
+
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Registros", f"{int(stats['Registros'])}")
+            with col2:
+                st.metric("Incidentes", f"{int(stats['Incidentes'])}")
+            with col3:
+                st.metric("% Incidentes", f"{stats['% Incidentes']:.1f}%")
+            with col4:
+                precision = stats['% Recipiente Correcto']
+                st.metric("Precisión Recipiente", "—" if pd.isna(precision) else f"{precision:.1f}%")
+
+            if columna_entidad == 'area':
+                relacionados = indice_entidades['area_usuarios'].get(entidad, [])
+                st.write(f"**Personal:** {', '.join(relacionados)}")
+            else:
+                relacionados = indice_entidades['usuario_areas'].get(entidad, [])
+                st.write(f"**Áreas:** {', '.join(relacionados)}")
+
+            st.markdown("---")
+
+            col1, col2 = st.columns(2)
+
+            with col1:
+                historial = df_entidad.groupby('fecha').agg({
+                    'timestamp': 'count',
+                    'incidente': lambda x: (x != 'NO').sum()
+                }).rename(columns={'timestamp': 'Registros', 'incidente': 'Incidentes'})
+                fig_historial = go.Figure(data=[
+                    go.Scatter(x=historial.index, y=historial['Registros'], name='Registros',
+                              mode='lines+markers', line=dict(color='#2180a8')),
+                    go.Scatter(x=historial.index, y=historial['Incidentes'], name='Incidentes',
+                              mode='lines+markers', line=dict(color='#c0152f'))
+                ])
+                fig_historial.update_layout(title="Historial", height=400, hovermode='x unified')
+                st.plotly_chart(fig_historial, use_container_width=True)
+
+            with col2:
+                residuo_entidad = df_entidad['tipo_residuo'].value_counts()
+                fig_residuo_entidad = px.pie(
+                    values=residuo_entidad.values,
+                    names=residuo_entidad.index,
+                    title="Tipos de Residuo"
+                )
+                st.plotly_chart(fig_residuo_entidad, use_container_width=True)
+
+            st.subheader("📋 Registros")
+            detalle = df_entidad[['timestamp', 'usuario', 'area', 'tipo_residuo', 'color_recipiente',
+                                  'estado_recipiente', 'incidente']].sort_values('timestamp', ascending=False)
+            st.dataframe(detalle, use_container_width=True, hide_index=True)
+
 else:
     st.warning("Por favor carga datos para comenzar el análisis")
 
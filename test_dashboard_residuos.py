@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""Pruebas de las funciones auxiliares del dashboard (ejecutar con: pytest -q)"""
+
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import dashboard_residuos as dr
+
+CSV_COMPLETO = """Marca temporal;1. USUARIO;2. ÁREA;3. TIPO DE RESIDUOS ;COLOR DEL RECIPIENTE;Columna 12;Columna 13
+10/3/2025 18:37:51;MARIA  ROJAS ;ODONTOLOGIA E HIGIENE ORAL;BIOSANITARIOS;ROJO;MEDIO (25% - 75%);DERRAME
+10/3/2025 18:40:00;JUAN;LABORATORIO;biosanitarios;rojo;VACIO  (<25%);
+no es fecha;JUAN;LABORATORIO;CORTOPUNZANTES;Guardián;LLENO (>75%);
+10/4/2025 08:00:00;;LABORATORIO;PLASTICO;AZUL;RARO;
+10/4/2025 09:00:00;ANA;;RESIDUOS QUÍMICOS DE LABORATORIO CLÍNICO;;;
+"""
+
+CSV_DETALLE = """Marca temporal;1. USUARIO;2. ÁREA;3. TIPO DE RESIDUOS ;COLOR DEL RECIPIENTE
+10/3/2025 18:37:51;MARIA ROJAS;ODONTOLOGIA E HIGIENE ORAL;BIOSANITARIOS;ROJO
+10/3/2025 18:40:00;JUAN;LABORATORIO;BIOSANITARIOS;ROJO
+10/4/2025 09:00:00;ANA;LABORATORIO;CORTOPUNZANTES;
+10/4/2025 10:00:00;JUAN;LABORATORIO;CORTOPUNZANTES;ROJO
+"""
+
+CSV_SOLO_OBLIGATORIAS = """Marca temporal;1. USUARIO;3. TIPO DE RESIDUOS
+10/3/2025 18:37:51;MARIA ROJAS;BIOSANITARIOS
+10/5/2025 07:10:00;JUAN;CORTOPUNZANTES
+"""
+
+
+def leer_csv(texto):
+    return pd.read_csv(io.StringIO(texto), sep=';', encoding='utf-8')
+
+
+def cargar(texto):
+    """Replica la carga del sidebar sin pasar por el file_uploader"""
+    df, cuarentena = dr.validar_datos(leer_csv(texto))
+    df['fecha'] = df['timestamp'].dt.date
+    df['hora'] = df['timestamp'].dt.hour
+    return dr.procesar_datos(df), cuarentena
+
+
+# ============================================================================
+# VALIDACIÓN DE DATOS
+# ============================================================================
+
+def test_resolver_encabezados_tolera_variantes():
+    encabezados = dr.resolver_encabezados([
+        'marca temporal', 'USUARIO', '2. AREA', '3. TIPO DE RESIDUOS ',
+        'Color del recipiente', 'Columna 12', 'Columna 13'
+    ])
+    assert encabezados == {
+        'timestamp': 'marca temporal',
+        'usuario': 'USUARIO',
+        'area': '2. AREA',
+        'tipo_residuo': '3. TIPO DE RESIDUOS ',
+        'color_recipiente': 'Color del recipiente',
+        'estado_recipiente': 'Columna 12',
+        'observaciones': 'Columna 13'
+    }
+
+
+def test_resolver_encabezados_no_confunde_columnas_genericas():
+    encabezados = dr.resolver_encabezados(['Marca temporal', '1. USUARIO', '3. TIPO DE RESIDUOS', 'Columna 13'])
+    assert 'estado_recipiente' not in encabezados
+    assert encabezados['observaciones'] == 'Columna 13'
+
+
+def test_validar_datos_sin_columnas_obligatorias():
+    with pytest.raises(ValueError, match='timestamp'):
+        dr.validar_datos(pd.DataFrame({'1. USUARIO': ['ANA'], '3. TIPO DE RESIDUOS': ['BIOSANITARIOS']}))
+
+
+def test_validar_datos_normaliza_dominios():
+    validos, _ = dr.validar_datos(leer_csv(CSV_COMPLETO))
+
+    assert list(validos.index) == [0, 1, 4]
+    assert validos['usuario'].tolist() == ['MARIA ROJAS', 'JUAN', 'ANA']
+    assert validos['tipo_residuo'].tolist() == [
+        'BIOSANITARIOS', 'BIOSANITARIOS', 'RESIDUOS QUIMICOS DE LABORATORIO CLINICO'
+    ]
+    assert validos['color_recipiente'].tolist()[:2] == ['ROJO', 'ROJO']
+    assert validos['estado_recipiente'].tolist()[:2] == ['MEDIO', 'VACÍO']
+    assert pd.isna(validos.loc[4, 'area'])
+
+
+def test_validar_datos_cuarentena_con_motivos():
+    _, cuarentena = dr.validar_datos(leer_csv(CSV_COMPLETO))
+
+    assert list(cuarentena.index) == [2, 3]
+    # La cuarentena conserva los valores originales del archivo
+    assert cuarentena.loc[2, 'Marca temporal'] == 'no es fecha'
+    assert cuarentena.loc[2, 'motivo'] == 'FECHA INVÁLIDA'
+    assert cuarentena.loc[3, 'motivo'] == (
+        'USUARIO VACÍO; TIPO DE RESIDUO DESCONOCIDO; '
+        'COLOR DE RECIPIENTE DESCONOCIDO; ESTADO DE RECIPIENTE DESCONOCIDO'
+    )
+
+
+def test_validar_datos_espacios_en_blanco_son_vacios():
+    csv = """Marca temporal;1. USUARIO;2. ÁREA;3. TIPO DE RESIDUOS ;COLOR DEL RECIPIENTE;Columna 12;Columna 13
+10/3/2025 18:37:51;ANA;LABORATORIO;BIOSANITARIOS; ; ; 
+10/3/2025 18:40:00;JUAN;LABORATORIO;   ;ROJO;LLENO (>75%);
+"""
+    validos, cuarentena = dr.validar_datos(leer_csv(csv))
+
+    assert list(validos.index) == [0]
+    assert validos.loc[0, ['color_recipiente', 'estado_recipiente', 'observaciones']].isna().all()
+    assert cuarentena.loc[1, 'motivo'] == 'TIPO DE RESIDUO VACÍO'
+
+
+def test_validar_datos_sin_columnas_opcionales():
+    df, cuarentena = cargar(CSV_SOLO_OBLIGATORIAS)
+
+    assert len(df) == 2 and len(cuarentena) == 0
+    assert (df['incidente'] == 'NO').all()
+    assert (df['estado_recipiente'] == 'NO REGISTRADO').all()
+
+
+def test_dashboard_renderiza_sin_columnas_opcionales():
+    df, cuarentena = cargar(CSV_SOLO_OBLIGATORIAS)
+
+    app = AppTest.from_file('dashboard_residuos.py', default_timeout=30)
+    app.session_state['df_original'] = df
+    app.session_state['df_processed'] = df
+    app.session_state['df_cuarentena'] = cuarentena
+    app.session_state['indice_diario'] = dr.construir_indice_diario(df)
+    app.run()
+
+    assert not app.exception
+    assert len(app.tabs) == 7
+
+    # La comparación de períodos también debe renderizar para cada dimensión
+    for dimension in dr.DIMENSIONES_INDICE:
+        [caja for caja in app.selectbox if caja.label == 'Comparar por'][0].set_value(dimension).run()
+        assert not app.exception
+
+
+# ============================================================================
+# ÍNDICE DIARIO Y COMPARACIÓN DE PERÍODOS
+# ============================================================================
+
+@pytest.fixture
+def registros_diarios():
+    rng = np.random.default_rng(0)
+    n = 3000
+    df = pd.DataFrame({
+        'fecha': (pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 500, n), 'D')).date,
+        'area': rng.choice(['LABORATORIO', 'ODONTOLOGIA', None], n),
+        'tipo_residuo': rng.choice(['BIOSANITARIOS', 'CORTOPUNZANTES', 'RESIDUOS APROVECHABLES'], n),
+        'incidente': rng.choice(['NO', 'DERRAME'], n)
+    })
+    return df
+
+
+def contar_directo(df, desde, hasta, columna, areas=None, tipos=None):
+    fechas = pd.to_datetime(df['fecha'])
+    mascara = fechas.between(pd.Timestamp(desde), pd.Timestamp(hasta))
+    if areas is not None:
+        mascara &= df['area'].isin(areas)
+    if tipos is not None:
+        mascara &= df['tipo_residuo'].isin(tipos)
+    subset = df[mascara]
+    return pd.DataFrame({
+        'Registros': subset.groupby(columna).size(),
+        'Incidentes': (subset['incidente'] != 'NO').groupby([subset[c] for c in np.atleast_1d(columna)]).sum()
+    })
+
+
+def test_rango_indice(registros_diarios):
+    indice = dr.construir_indice_diario(registros_diarios)
+    fechas = pd.to_datetime(registros_diarios['fecha'])
+    assert dr.rango_indice(indice) == (fechas.min().date(), fechas.max().date())
+
+
+@pytest.mark.parametrize('columna', ['area', 'tipo_residuo', ['area', 'tipo_residuo']])
+def test_consultar_rango_coincide_con_conteo_directo(registros_diarios, columna):
+    indice = dr.construir_indice_diario(registros_diarios)
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        desde, hasta = sorted(pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 500, 2), 'D'))
+        obtenido = dr.consultar_rango(indice, desde, hasta, columna)
+        esperado = contar_directo(registros_diarios, desde, hasta, columna)
+        esperado = esperado.reindex(obtenido.index, fill_value=0)
+        pd.testing.assert_frame_equal(obtenido, esperado, check_dtype=False, check_names=False)
+
+
+def test_consultar_rango_aplica_ambos_filtros(registros_diarios):
+    indice = dr.construir_indice_diario(registros_diarios)
+    filtros = dict(areas=['LABORATORIO'], tipos=['CORTOPUNZANTES', 'BIOSANITARIOS'])
+    obtenido = dr.consultar_rango(indice, '2023-03-01', '2023-09-30', 'area', **filtros)
+    esperado = contar_directo(registros_diarios, '2023-03-01', '2023-09-30', 'area', **filtros)
+    assert obtenido.index.tolist() == ['LABORATORIO']
+    assert obtenido.loc['LABORATORIO'].tolist() == esperado.loc['LABORATORIO'].tolist()
+
+
+def test_consultar_rango_fuera_del_indice(registros_diarios):
+    indice = dr.construir_indice_diario(registros_diarios)
+    total = dr.consultar_rango(indice, '2000-01-01', '2030-01-01', 'area')
+    assert total['Registros'].sum() == registros_diarios['area'].notna().sum()
+
+    for desde, hasta in [('2030-01-01', '2030-02-01'), ('2020-01-01', '2020-12-31'), ('2023-05-10', '2023-05-01')]:
+        vacio = dr.consultar_rango(indice, desde, hasta, 'area')
+        assert (vacio['Registros'] == 0).all() and (vacio['Incidentes'] == 0).all()
+
+
+def test_consultar_rango_total_incluye_area_vacia(registros_diarios):
+    indice = dr.construir_indice_diario(registros_diarios)
+    total = dr.consultar_rango(indice, '2023-03-01', '2023-09-30', None)
+    fechas = pd.to_datetime(registros_diarios['fecha'])
+    subset = registros_diarios[fechas.between('2023-03-01', '2023-09-30')]
+    assert total['Registros'] == len(subset)
+    assert total['Incidentes'] == (subset['incidente'] != 'NO').sum()
+
+
+def test_totales_de_comparacion_no_dependen_del_desglose():
+    df, cuarentena = cargar(CSV_COMPLETO)
+
+    app = AppTest.from_file('dashboard_residuos.py', default_timeout=30)
+    app.session_state['df_original'] = df
+    app.session_state['df_processed'] = df
+    app.session_state['df_cuarentena'] = cuarentena
+    app.session_state['indice_diario'] = dr.construir_indice_diario(df)
+    app.run()
+    # Con un multiselect vacío no se filtra: el registro sin área también cuenta
+    app.multiselect[0].set_value([]).run()
+
+    for dimension in dr.DIMENSIONES_INDICE:
+        [caja for caja in app.selectbox if caja.label == 'Comparar por'][0].set_value(dimension).run()
+        assert not app.exception
+        # El primer 'Registros' es el de la comparación (Detalle se renderiza después)
+        registros = [metrica.value for metrica in app.metric if metrica.label == 'Registros'][0]
+        assert registros == '3'
+
+
+def test_periodos_comparacion_semana():
+    actual, anterior = dr.periodos_comparacion('Semana vs semana anterior', '2025-01-01', '2025-03-14')
+    assert actual == (pd.Timestamp('2025-03-08'), pd.Timestamp('2025-03-14'))
+    assert anterior == (pd.Timestamp('2025-03-01'), pd.Timestamp('2025-03-07'))
+
+
+def test_periodos_comparacion_mes_bisiesto():
+    actual, anterior = dr.periodos_comparacion('Mes vs mismo mes año anterior', '2024-01-01', '2024-02-29')
+    assert actual == (pd.Timestamp('2024-02-01'), pd.Timestamp('2024-02-29'))
+    assert anterior == (pd.Timestamp('2023-02-01'), pd.Timestamp('2023-02-28'))
+
+
+def test_periodos_comparacion_rango_anterior():
+    actual, anterior = dr.periodos_comparacion('Rango seleccionado vs período anterior', '2025-03-01', '2025-03-10')
+    assert actual == (pd.Timestamp('2025-03-01'), pd.Timestamp('2025-03-10'))
+    assert anterior == (pd.Timestamp('2025-02-19'), pd.Timestamp('2025-02-28'))
+
+
+def test_comparar_periodos_deltas(registros_diarios):
+    indice = dr.construir_indice_diario(registros_diarios)
+    actual, anterior = dr.periodos_comparacion('Semana vs semana anterior', '2023-01-01', '2023-06-30')
+    comparacion = dr.comparar_periodos(indice, actual, anterior, 'tipo_residuo')
+    assert (comparacion['Δ Registros'] == comparacion['Registros'] - comparacion['Registros Anterior']).all()
+    assert (comparacion['Δ Incidentes'] == comparacion['Incidentes'] - comparacion['Incidentes Anterior']).all()
+
+
+# ============================================================================
+# ÍNDICE DE ENTIDADES (USUARIO / ÁREA)
+# ============================================================================
+
+@pytest.fixture
+def registros_personal():
+    df = pd.DataFrame({
+        'usuario': ['ANA', 'ANA', 'JUAN', 'JUAN', 'LUIS', None],
+        'area': ['LABORATORIO', 'ODONTOLOGIA', 'LABORATORIO', 'LABORATORIO', 'ODONTOLOGIA', 'LABORATORIO'],
+        'tipo_residuo': ['BIOSANITARIOS', 'CORTOPUNZANTES', 'BIOSANITARIOS', 'BIOSANITARIOS',
+                         'BIOSANITARIOS', 'BIOSANITARIOS'],
+        'color_recipiente': ['ROJO', 'ROJO', 'ROJO', np.nan, np.nan, 'ROJO'],
+        'incidente': ['NO', 'DERRAME', 'NO', 'NO', 'FALTA BOLSA', 'NO']
+    }, index=[10, 11, 12, 13, 14, 15])
+    return dr.crear_prediccion_qr(df)
+
+
+def test_construir_indice_entidades_relaciones(registros_personal):
+    indice = dr.construir_indice_entidades(registros_personal)
+
+    assert indice['area_usuarios'] == {'LABORATORIO': ['ANA', 'JUAN'], 'ODONTOLOGIA': ['ANA', 'LUIS']}
+    assert indice['usuario_areas'] == {'ANA': ['LABORATORIO', 'ODONTOLOGIA'], 'JUAN': ['LABORATORIO'],
+                                       'LUIS': ['ODONTOLOGIA']}
+
+
+def test_construir_indice_entidades_estadisticas(registros_personal):
+    indice = dr.construir_indice_entidades(registros_personal)
+    usuarios = indice['usuario']['stats']
+    areas = indice['area']['stats']
+
+    assert usuarios.loc['ANA', ['Registros', 'Incidentes', '% Incidentes']].tolist() == [2, 1, 50.0]
+    # ANA usó ROJO para cortopunzantes (GUARDIAN): 1 de 2 correctos
+    assert usuarios.loc['ANA', '% Recipiente Correcto'] == 50.0
+    # JUAN tiene un registro sin color: solo cuenta el que sí lo tiene
+    assert usuarios.loc['JUAN', '% Recipiente Correcto'] == 100.0
+    # LUIS no registró colores: sin datos, no 0%
+    assert pd.isna(usuarios.loc['LUIS', '% Recipiente Correcto'])
+
+    assert areas.loc['LABORATORIO', ['Registros', 'Usuarios', 'Incidentes']].tolist() == [4, 2, 0]
+    assert areas.loc['ODONTOLOGIA', ['Registros', 'Usuarios', 'Incidentes']].tolist() == [2, 2, 2]
+
+
+def test_filas_entidad(registros_personal):
+    indice = dr.construir_indice_entidades(registros_personal)
+
+    assert dr.filas_entidad(registros_personal, indice, 'usuario', 'JUAN').index.tolist() == [12, 13]
+    assert dr.filas_entidad(registros_personal, indice, 'area', 'ODONTOLOGIA').index.tolist() == [11, 14]
+    assert dr.filas_entidad(registros_personal, indice, 'usuario', 'NADIE').empty
+
+
+def test_indice_entidades_se_reutiliza_entre_ejecuciones():
+    df, cuarentena = cargar(CSV_DETALLE)
+
+    app = AppTest.from_file('dashboard_residuos.py', default_timeout=30)
+    app.session_state['df_original'] = df
+    app.session_state['df_processed'] = df
+    app.session_state['df_cuarentena'] = cuarentena
+    app.session_state['indice_diario'] = dr.construir_indice_diario(df)
+    app.run()
+    indice = app.session_state['indice_entidades']
+
+    # Cambiar de usuario en el detalle no reconstruye el índice
+    detalle = [caja for caja in app.selectbox if caja.label == 'Selecciona usuario'][0]
+    detalle.set_value('JUAN').run()
+    assert not app.exception
+    assert app.session_state['indice_entidades'] is indice
+
+    # ANA no registró color de recipiente: la precisión se muestra sin datos
+    [caja for caja in app.selectbox if caja.label == 'Selecciona usuario'][0].set_value('ANA').run()
+    precision = [metrica for metrica in app.metric if metrica.label == 'Precisión Recipiente'][0]
+    assert precision.value == '—'
+
+    # Cambiar un filtro sí lo reconstruye
+    app.multiselect[0].set_value(['LABORATORIO']).run()
+    assert not app.exception
+    assert app.session_state['indice_entidades'] is not indice
+
+
+def test_precision_recipiente_coincide_entre_pestanas():
+    df, cuarentena = cargar(CSV_DETALLE)
+
+    app = AppTest.from_file('dashboard_residuos.py', default_timeout=30)
+    app.session_state['df_original'] = df
+    app.session_state['df_processed'] = df
+    app.session_state['df_cuarentena'] = cuarentena
+    app.session_state['indice_diario'] = dr.construir_indice_diario(df)
+    app.run()
+    app.multiselect[0].set_value(['LABORATORIO']).run()
+    app.radio[0].set_value('Área').run()
+    assert not app.exception
+
+    metricas = {metrica.label: metrica.value for metrica in app.metric}
+    # LABORATORIO: un acierto, un error y un registro sin color (excluido)
+    assert metricas['Precisión Actual'] == '50.0%'
+    assert metricas['Precisión Recipiente'] == '50.0%'